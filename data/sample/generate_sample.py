@@ -6,18 +6,20 @@ Run: python data/sample/generate_sample.py
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
 import os
 
 # Set seed for reproducibility
-np.random.seed(42)
-random.seed(42)
+rng = np.random.default_rng(42)
 
 # Configuration
 N_TRANSACTIONS = 10000
 START_DATE = datetime(2010, 1, 1)
 END_DATE = datetime(2011, 12, 9)
+FIRST_INVOICE = 536365  # Starting invoice number (matches real data)
+
+# Items per invoice (1-12, weighted towards smaller)
+ITEM_COUNT_WEIGHTS = [0.25, 0.20, 0.15, 0.12, 0.08, 0.06, 0.05, 0.03, 0.02, 0.02, 0.01, 0.01]
 
 # Sample products (realistic gift items from the actual dataset)
 PRODUCTS = [
@@ -73,6 +75,11 @@ PRODUCTS = [
     ('23167', 'SMALL CERAMIC TOP STORAGE JAR', 0.85),
 ]
 
+# Column views of PRODUCTS, indexed by the sampled product positions
+PRODUCT_CODES = np.array([p[0] for p in PRODUCTS], dtype=object)
+PRODUCT_DESCRIPTIONS = np.array([p[1] for p in PRODUCTS], dtype=object)
+PRODUCT_PRICES = np.array([p[2] for p in PRODUCTS], dtype=np.float64)
+
 # Countries with weights (UK dominant, matches real distribution)
 COUNTRIES = [
     ('United Kingdom', 0.82),
@@ -95,55 +102,61 @@ COUNTRIES = [
     ('Poland', 0.002),
     ('Cyprus', 0.005),  # Total = 1.0
 ]
+COUNTRY_NAMES = np.array([c[0] for c in COUNTRIES], dtype=object)
+COUNTRY_CDF = np.cumsum([c[1] for c in COUNTRIES])
+COUNTRY_CDF /= COUNTRY_CDF[-1]
+
+# Weight towards November and December (holiday season)
+MONTH_WEIGHTS = [0.06, 0.06, 0.07, 0.07, 0.08, 0.08, 0.08, 0.08, 0.09, 0.09, 0.12, 0.12]
+MONTH_CDF = np.cumsum(MONTH_WEIGHTS)
+MONTH_CDF /= MONTH_CDF[-1]
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])  # Indexed by month; Feb capped at 28
+
+# Business hours weighted - peak around lunch
+HOUR_WEIGHTS = [0.01, 0.01, 0.01, 0.01, 0.01, 0.02, 0.03, 0.05, 0.08, 0.10,
+                0.12, 0.12, 0.10, 0.08, 0.07, 0.06, 0.05, 0.03, 0.02, 0.01,
+                0.005, 0.005, 0.005, 0.005]
+HOUR_CDF = np.cumsum(HOUR_WEIGHTS)
+HOUR_CDF /= HOUR_CDF[-1]  # Normalize to sum to 1
+
+# Quantity weights ~ 1/q: 1-72 for items under £1, 1-24 otherwise
+CHEAP_QTY_CDF = np.cumsum(1 / np.arange(1, 73))
+CHEAP_QTY_CDF /= CHEAP_QTY_CDF[-1]
+STD_QTY_CDF = np.cumsum(1 / np.arange(1, 25))
+STD_QTY_CDF /= STD_QTY_CDF[-1]
 
 def generate_customers(n_customers=500):
     """Generate customer IDs with varying purchase frequencies."""
     # Some customers buy frequently, most buy rarely (power law)
     customer_ids = list(range(12346, 12346 + n_customers))
     # Assign purchase probability weights (power law distribution)
-    weights = np.random.pareto(1.5, n_customers) + 1
+    weights = rng.pareto(1.5, n_customers) + 1
     weights = weights / weights.sum()
     return customer_ids, weights
 
-def generate_invoice_date():
-    """Generate a random date with seasonal weighting (more in Nov-Dec)."""
-    # Generate base date
-    days_range = (END_DATE - START_DATE).days
-    
-    # Weight towards November and December (holiday season)
-    month_weights = [0.06, 0.06, 0.07, 0.07, 0.08, 0.08, 0.08, 0.08, 0.09, 0.09, 0.12, 0.12]
-    month = np.random.choice(range(1, 13), p=month_weights)
-    
-    # Random day in that month
-    if month == 2:
-        day = random.randint(1, 28)
-    elif month in [4, 6, 9, 11]:
-        day = random.randint(1, 30)
-    else:
-        day = random.randint(1, 31)
-    
-    # Random year (2010 or 2011)
-    year = random.choice([2010, 2011])
-    
-    try:
-        date = datetime(year, month, day)
-    except ValueError:
-        date = datetime(year, month, 28)  # Fallback for invalid dates
+def generate_invoice_dates(n_invoices):
+    """Generate random dates with seasonal weighting (more in Nov-Dec)."""
+    # Month, year and day for every invoice
+    months = np.searchsorted(MONTH_CDF, rng.random(n_invoices)) + 1
+    years = rng.choice([2010, 2011], size=n_invoices)
+    days = rng.integers(1, DAYS_IN_MONTH[months] + 1)  # Per-month upper bound, no calendar branches
     
     # Add time (business hours weighted - peak around lunch)
-    hour_weights = [0.01, 0.01, 0.01, 0.01, 0.01, 0.02, 0.03, 0.05, 0.08, 0.10, 
-                    0.12, 0.12, 0.10, 0.08, 0.07, 0.06, 0.05, 0.03, 0.02, 0.01, 
-                    0.005, 0.005, 0.005, 0.005]
-    # Normalize to sum to 1
-    hour_weights = np.array(hour_weights) / sum(hour_weights)
-    hour = np.random.choice(range(24), p=hour_weights)
-    minute = random.randint(0, 59)
-    
-    timestamp = date.replace(hour=hour, minute=minute)
-    # Clamp to END_DATE
-    if timestamp > END_DATE:
-        timestamp = END_DATE - timedelta(hours=np.random.uniform(1, 24))
-    return timestamp
+    hours = np.searchsorted(HOUR_CDF, rng.random(n_invoices))
+    minutes = rng.integers(0, 60, n_invoices)
+    
+    timestamps = pd.to_datetime(pd.DataFrame({
+        'year': years,
+        'month': months,
+        'day': days,
+        'hour': hours,
+        'minute': minutes
+    }))
+    
+    # Clamp to END_DATE, floored to whole minutes like every other timestamp
+    late = timestamps > END_DATE
+    timestamps[late] = (END_DATE - pd.to_timedelta(rng.uniform(1, 24, late.sum()), unit='h')).floor('min')
+    return timestamps
 
 def generate_sample_data():
     """Generate the complete sample dataset."""
@@ -155,61 +168,71 @@ def generate_sample_data():
     # Generate invoices (groups of items)
     n_invoices = N_TRANSACTIONS // 5  # Average 5 items per invoice
     
-    transactions = []
-    invoice_num = 536365  # Starting invoice number (matches real data)
-    
-    for _ in range(n_invoices):
-        # Generate invoice details
-        invoice_id = str(invoice_num)
-        invoice_date = generate_invoice_date()
-        customer_id = np.random.choice(customer_ids, p=customer_weights)
-        country = np.random.choice([c[0] for c in COUNTRIES], p=[c[1] for c in COUNTRIES])
-        
-        # Number of items in this invoice (1-12, weighted towards smaller)
-        n_items = np.random.choice(range(1, 13), p=[0.25, 0.20, 0.15, 0.12, 0.08, 0.06, 0.05, 0.03, 0.02, 0.02, 0.01, 0.01])
-        
-        # Select products for this invoice
-        selected_products = random.sample(PRODUCTS, min(n_items, len(PRODUCTS)))
-        
-        for product in selected_products:
-            stock_code, description, unit_price = product
-            
-            # Quantity (1-24, weighted towards smaller)
-            if unit_price < 1:
-                quantity = np.random.choice(range(1, 73), p=np.array([1/(i+1) for i in range(72)]) / sum([1/(i+1) for i in range(72)]))
-            else:
-                quantity = np.random.choice(range(1, 25), p=np.array([1/(i+1) for i in range(24)]) / sum([1/(i+1) for i in range(24)]))
-            
-            # Small price variation (+/- 10%)
-            price = unit_price * (1 + np.random.uniform(-0.1, 0.1))
-            price = round(price, 2)
-            
-            transactions.append({
-                'Invoice': invoice_id,
-                'StockCode': stock_code,
-                'Description': description,
-                'Quantity': quantity,
-                'InvoiceDate': invoice_date,
-                'Price': price,
-                'Customer ID': customer_id,
-                'Country': country
-            })
-        
-        invoice_num += 1
-    
-    # Create DataFrame
-    df = pd.DataFrame(transactions)
+    # Invoice-level details, drawn for all invoices at once
+    invoice_ids = np.arange(n_invoices, dtype=np.int64) + FIRST_INVOICE
+    invoice_dates = generate_invoice_dates(n_invoices)
+    
+    # Weighted customer/country draws via cumulative weights + searchsorted
+    customer_cdf = np.cumsum(customer_weights)
+    customer_cdf /= customer_cdf[-1]
+    invoice_customers = np.asarray(customer_ids)[np.searchsorted(customer_cdf, rng.random(n_invoices))]
+    
+    invoice_countries = COUNTRY_NAMES[np.searchsorted(COUNTRY_CDF, rng.random(n_invoices))]
+    
+    # Number of items in each invoice (1-12, weighted towards smaller)
+    items_per_invoice = rng.choice(np.arange(1, 13), size=n_invoices, p=ITEM_COUNT_WEIGHTS)
+    n_rows = items_per_invoice.sum()
+    
+    # Select products for every line item
+    # Distinct products within an invoice: argsorting a row of uniforms gives
+    # a random permutation of the catalogue, so its first k entries are a
+    # random k-sample without replacement
+    max_items = items_per_invoice.max()
+    candidates = rng.random((n_invoices, len(PRODUCTS))).argsort(axis=1)[:, :max_items]
+    product_idx = candidates[np.arange(max_items) < items_per_invoice[:, None]]
+    unit_price = PRODUCT_PRICES[product_idx]
+    
+    # Quantity (1-24, weighted towards smaller; 1-72 for items under £1)
+    u = rng.random(n_rows)
+    is_cheap = unit_price < 1
+    quantity = np.empty(n_rows, dtype=np.int32)
+    quantity[is_cheap] = np.searchsorted(CHEAP_QTY_CDF, u[is_cheap]) + 1
+    quantity[~is_cheap] = np.searchsorted(STD_QTY_CDF, u[~is_cheap]) + 1
+    
+    # Small price variation (+/- 10%), applied in place on one float64 buffer.
+    # float64 is kept so Quantity * Price stays exact to the penny in the CSV.
+    price = rng.uniform(0.9, 1.1, n_rows)
+    price *= unit_price
+    np.round(price, 2, out=price)
+    
+    # Create DataFrame column by column (invoice details repeated per line item)
+    df = pd.DataFrame({
+        'Invoice': np.repeat(invoice_ids, items_per_invoice),
+        'StockCode': pd.Categorical(PRODUCT_CODES[product_idx], categories=PRODUCT_CODES),
+        'Description': pd.Categorical(PRODUCT_DESCRIPTIONS[product_idx], categories=PRODUCT_DESCRIPTIONS),
+        'Quantity': quantity,
+        'InvoiceDate': np.repeat(invoice_dates.values, items_per_invoice),
+        'Price': price,
+        'Customer ID': np.repeat(invoice_customers, items_per_invoice),
+        'Country': pd.Categorical(np.repeat(invoice_countries, items_per_invoice), categories=COUNTRY_NAMES)
+    })
     
     # Sort by date
     df = df.sort_values('InvoiceDate').reset_index(drop=True)
     
     # Add calculated fields (matching preprocessing.py output)
     df['Revenue'] = df['Quantity'] * df['Price']
-    df['Year'] = df['InvoiceDate'].dt.year
-    df['Month'] = df['InvoiceDate'].dt.month
-    df['YearMonth'] = df['InvoiceDate'].dt.to_period('M').astype(str)
-    df['DayOfWeek'] = df['InvoiceDate'].dt.dayofweek
-    df['Hour'] = df['InvoiceDate'].dt.hour
+    dt = df['InvoiceDate'].dt
+    years = dt.year.to_numpy()
+    months = dt.month.to_numpy()
+    df['Year'] = years
+    df['Month'] = months
+    # 'YYYY-MM' labels: format each distinct month once, then gather
+    year_months, year_month_idx = np.unique(years * 100 + months, return_inverse=True)
+    labels = np.array([f"{ym // 100}-{ym % 100:02d}" for ym in year_months], dtype=object)
+    df['YearMonth'] = labels[year_month_idx]
+    df['DayOfWeek'] = dt.dayofweek
+    df['Hour'] = dt.hour
     
     print(f"✅ Generated {len(df):,} transactions")
     print(f"   - {df['Invoice'].nunique():,} invoices")
@@ -230,14 +253,16 @@ def main():
     
     # Save to CSV
     output_path = os.path.join(script_dir, 'sample_data.csv')
-    df.to_csv(output_path, index=False)
+    # Fixed-precision formats: all money values are whole pence and all
+    # timestamps are whole minutes, which keeps the file small
+    df.to_csv(output_path, index=False, float_format='%.2f', date_format='%Y-%m-%d %H:%M:%S')
     print(f"\n💾 Saved to: {output_path}")
     
-    # Also save to processed folder for immediate use
+    # Also save to processed folder for immediate use (Parquet keeps dtypes)
     processed_dir = os.path.join(script_dir, '..', 'processed')
     os.makedirs(processed_dir, exist_ok=True)
-    df.to_csv(os.path.join(processed_dir, 'cleaned_transactions.csv'), index=False)
-    print(f"💾 Also saved to: data/processed/cleaned_transactions.csv")
+    df.to_parquet(os.path.join(processed_dir, 'cleaned_transactions.parquet'), index=False, compression='snappy')
+    print(f"💾 Also saved to: data/processed/cleaned_transactions.parquet")
     
     return df
 
@@ -7,6 +7,7 @@ Run: streamlit run demo/app.py
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
@@ -18,13 +19,13 @@ sys.path.append(str(Path(__file__).parent.parent / 'src'))
 
 from data_loader import load_data, check_data_availability
 from metrics import (
-    calculate_revenue_metrics,
-    calculate_customer_metrics,
-    calculate_geographic_metrics,
-    calculate_time_metrics,
+    calculate_dashboard_metrics,
     format_currency,
     format_percentage,
-    format_number
+    format_number,
+    quantile_score,
+    rank_score,
+    sum_by
 )
 
 # Page config
@@ -64,18 +65,212 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-@st.cache_data
+@st.cache_resource
 def get_data():
-    """Load and cache data."""
+    """
+    Load and cache data.
+    
+    Cached as a shared resource rather than with cache_data, which would
+    unpickle a fresh copy of the whole frame on every call. Callers only
+    read and slice it, never modify it.
+    """
     try:
         df = load_data(use_sample=False)
-        return df
+        # Stored categories may include countries without rows (the sample
+        # generator declares every configured country); drop them so the
+        # sidebar only offers countries that have data
+        df['Country'] = df['Country'].cat.remove_unused_categories()
+        # Sorted dates let apply_filters slice date ranges by binary search
+        return df.sort_values('InvoiceDate', kind='stable', ignore_index=True)
     except FileNotFoundError:
         st.error("⚠️ Data not found. Please run preprocessing first.")
         st.code("python src/preprocessing.py", language="bash")
         st.stop()
 
 
+def apply_filters(df: pd.DataFrame, date_start, date_end, country: str) -> pd.DataFrame:
+    """
+    Filter transactions to a date range (inclusive) and country.
+    
+    df must be sorted by InvoiceDate (get_data guarantees this), so the date
+    range is located with two binary searches and taken as a row slice.
+    """
+    if date_start is not None and date_end is not None:
+        # End is exclusive midnight of the next day
+        bounds = np.array(
+            [pd.Timestamp(date_start), pd.Timestamp(date_end) + pd.Timedelta(days=1)],
+            dtype='datetime64[ns]'
+        )
+        start, end = np.searchsorted(df['InvoiceDate'].to_numpy(), bounds)
+        if start > 0 or end < len(df):
+            df = df.iloc[start:end]
+    
+    if country != 'All':
+        df = df[(df['Country'] == country).to_numpy()]
+    
+    return df
+
+
+@st.cache_data
+def compute_metrics(date_start, date_end, country: str) -> dict:
+    """Calculate and cache dashboard metrics, keyed on the filter values."""
+    filtered_df = apply_filters(get_data(), date_start, date_end, country)
+    
+    return calculate_dashboard_metrics(filtered_df)
+
+
+@st.cache_data
+def compute_filter_summary(date_start, date_end, country: str) -> dict:
+    """Row, customer and revenue totals for the filter selection (cached per selection)."""
+    filtered_df = apply_filters(get_data(), date_start, date_end, country)
+    
+    return {
+        'transactions': len(filtered_df),
+        'customers': filtered_df['Customer ID'].nunique(),
+        'revenue': filtered_df['Revenue'].sum()
+    }
+
+
+@st.cache_data
+def compute_monthly_revenue(date_start, date_end, country: str) -> pd.DataFrame:
+    """Monthly revenue for the filter selection (cached per selection)."""
+    df = apply_filters(get_data(), date_start, date_end, country)
+    
+    # YearMonth is already a 'YYYY-MM' string in both the sample and processed data
+    return sum_by(df['YearMonth'], df['Revenue']).reset_index()
+
+
+@st.cache_data
+def compute_top_products(date_start, date_end, country: str) -> pd.DataFrame:
+    """Top 10 products by revenue for the filter selection (cached per selection)."""
+    df = apply_filters(get_data(), date_start, date_end, country)
+    
+    # Group on StockCode alone, then label products with their first description
+    product_stats = df.groupby('StockCode', observed=True).agg({
+        'Revenue': 'sum',
+        'Quantity': 'sum',
+        'Invoice': 'nunique'
+    }).reset_index()
+    descriptions = df.loc[~df['StockCode'].duplicated().to_numpy(), ['StockCode', 'Description']]
+    product_stats = product_stats.merge(descriptions, on='StockCode', how='left')[
+        ['StockCode', 'Description', 'Revenue', 'Quantity', 'Invoice']
+    ]
+    return product_stats.sort_values('Revenue', ascending=False).head(10)
+
+
+@st.cache_data
+def compute_segment_summary(date_start, date_end, country: str) -> pd.DataFrame:
+    """RFM segment sizes and revenue for the filter selection (cached per selection)."""
+    df = apply_filters(get_data(), date_start, date_end, country)
+
+    # RFM table (per customer)
+    snapshot_date = df["InvoiceDate"].max() + pd.Timedelta(days=1)
+
+    customer_stats = (
+        df.groupby("Customer ID", observed=True)
+        .agg(
+            LastPurchase=("InvoiceDate", "max"),
+            Frequency=("Invoice", "nunique"),
+            Monetary=("Revenue", "sum"),
+        )
+        .reset_index()
+    )
+    # Days since last purchase, computed on the whole column at once
+    customer_stats.insert(1, "Recency", (snapshot_date - customer_stats.pop("LastPurchase")).dt.days)
+
+    # R/F/M scores (1–5)
+    # Recent customers score high, so the recency buckets are reversed
+    customer_stats["R_Score"] = 6 - quantile_score(customer_stats["Recency"].to_numpy())
+
+    # Frequency has heavy ties; score its rank (ties broken by order, like
+    # rank(method="first")) so the buckets stay equal-sized
+    customer_stats["F_Score"] = rank_score(customer_stats["Frequency"].to_numpy())
+
+    customer_stats["M_Score"] = quantile_score(customer_stats["Monetary"].to_numpy())
+
+    # Segment rules (not equal-sized → realistic); first matching rule wins
+    r = customer_stats["R_Score"].to_numpy()
+    f = customer_stats["F_Score"].to_numpy()
+    m = customer_stats["M_Score"].to_numpy()
+    conditions = [
+        (r >= 4) & (f >= 4) & (m >= 4),
+        (r >= 3) & (f >= 4) & (m >= 3),
+        (r >= 4) & (f <= 2),
+        (r == 3) & (f >= 3) & (m >= 3),
+        (r <= 2) & (f >= 3),
+        (r <= 2) & (f <= 2),
+    ]
+    segments = ["Champions", "Loyal Customers", "New Customers", "Potential Loyalists", "At Risk", "Lost"]
+    customer_stats["Segment"] = np.select(conditions, segments, default="Need Attention")
+
+    # Customers + Revenue per segment for the charts
+    segment_summary = customer_stats.groupby("Segment", observed=True).agg({
+        "Customer ID": "count",
+        "Monetary": "sum"
+    }).reset_index()
+    segment_summary.columns = ["Segment", "Customers", "Revenue"]
+
+    return segment_summary
+
+
+@st.cache_data
+def compute_cohort_retention(date_start, date_end, country: str):
+    """
+    Monthly cohort retention matrix for the filter selection (cached per selection).
+    
+    Returns:
+        DataFrame of retention % (cohorts x months since first purchase),
+        or None when no cohort has a month-0 column
+    """
+    df = apply_filters(get_data(), date_start, date_end, country)
+    d = df.dropna(subset=["Customer ID", "InvoiceDate"])
+
+    # Months as integers (year * 12 + month - 1); cohort = first purchase month
+    tx_month = (d["InvoiceDate"].dt.year * 12 + d["InvoiceDate"].dt.month - 1).to_numpy()
+    cohort_month = pd.Series(tx_month, index=d.index).groupby(d["Customer ID"], observed=True).transform("min").to_numpy()
+
+    # Months since first purchase
+    cohort_age = tx_month - cohort_month
+    if len(cohort_age) == 0:
+        return None
+
+    # Count active customers by cohort + age: keep one entry per
+    # (customer, age) pair, then tally pairs into a dense cohort x age grid
+    customer_codes, _ = pd.factorize(d["Customer ID"])
+    n_ages = cohort_age.max() + 1
+    pairs = np.unique(customer_codes.astype(np.int64) * n_ages + cohort_age)
+    first_month = cohort_month.min()
+    customer_cohort = np.empty(customer_codes.max() + 1, dtype=np.int64)
+    customer_cohort[customer_codes] = cohort_month - first_month
+    cells = customer_cohort[pairs // n_ages] * n_ages + pairs % n_ages
+    n_cohorts = customer_cohort.max() + 1
+    counts = np.bincount(cells, minlength=n_cohorts * n_ages).reshape(n_cohorts, n_ages)
+
+    # Matrix of observed cohorts x observed ages
+    retention_matrix = pd.DataFrame(
+        counts,
+        index=pd.Index(np.arange(n_cohorts) + first_month, name="Cohort"),
+        columns=pd.Index(np.arange(n_ages), name="CohortAge"),
+        dtype=float
+    )
+    retention_matrix = retention_matrix.loc[counts.any(axis=1), counts.any(axis=0)]
+
+    # Convert to retention % (divide by month 0)
+    if 0 not in retention_matrix.columns:
+        return None
+
+    cohort_size = retention_matrix[0].replace(0, pd.NA)
+    retention_pct = (retention_matrix.divide(cohort_size, axis=0) * 100).fillna(0).round(1)
+
+    # Keep first N months so the chart stays readable
+    max_months = min(12, retention_pct.shape[1])
+    retention_pct = retention_pct.iloc[:, :max_months]
+
+    # Make labels nicer ('YYYY-MM')
+    retention_pct.index = pd.Index([f"{m // 12}-{m % 12 + 1:02d}" for m in retention_pct.index], name="Cohort")
+    return retention_pct
+
+
 def render_kpi_cards(metrics: dict):
     """Render the top KPI cards."""
     col1, col2, col3, col4 = st.columns(4)
@@ -109,13 +304,10 @@ def render_kpi_cards(metrics: dict):
         )
 
 
-def render_revenue_trend(df: pd.DataFrame):
+def render_revenue_trend(monthly: pd.DataFrame):
     """Render monthly revenue trend chart."""
     st.subheader("📈 Monthly Revenue Trend")
     
-    monthly = df.groupby('YearMonth')['Revenue'].sum().reset_index()
-    monthly['YearMonth'] = monthly['YearMonth'].astype(str)
-    
     fig = px.area(
         monthly,
         x='YearMonth',
@@ -139,17 +331,19 @@ def render_revenue_trend(df: pd.DataFrame):
     st.plotly_chart(fig, use_container_width=True)
     
     # Insight box
-    peak_month = monthly.loc[monthly['Revenue'].idxmax()]
+    revenue = monthly['Revenue'].to_numpy()
+    peak_idx = int(revenue.argmax())
+    peak_month = monthly['YearMonth'].iat[peak_idx]
     st.markdown(f"""
     <div class="insight-box">
-        <strong>💡 Insight:</strong> Peak revenue was in <strong>{peak_month['YearMonth']}</strong> 
-        with <strong>{format_currency(peak_month['Revenue'])}</strong>. 
+        <strong>💡 Insight:</strong> Peak revenue was in <strong>{peak_month}</strong> 
+        with <strong>{format_currency(revenue[peak_idx])}</strong>. 
         Peak revenue occurs in November, highlighting a clear holiday-season uplift.
     </div>
     """, unsafe_allow_html=True)
 
 
-def render_geographic_analysis(df: pd.DataFrame, metrics: dict):
+def render_geographic_analysis(metrics: dict):
     """Render geographic breakdown."""
     st.subheader("🌍 Revenue by Country")
     
@@ -209,65 +403,10 @@ def render_geographic_analysis(df: pd.DataFrame, metrics: dict):
         for _, row in intl.iterrows():
             st.markdown(f"• {row['Country']}: {format_currency(row['Revenue'])}")
 
-def render_customer_segments(df: pd.DataFrame):
+def render_customer_segments(segment_summary: pd.DataFrame):
     """Render RFM customer segmentation."""
     st.subheader("👥 Customer Segments (RFM Analysis)")
 
-    df = df.copy()
-    df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"], errors="coerce")
-
-    # RFM table (per customer)
-    snapshot_date = df["InvoiceDate"].max() + pd.Timedelta(days=1)
-
-    customer_stats = (
-        df.groupby("Customer ID")
-        .agg(
-            Recency=("InvoiceDate", lambda x: (snapshot_date - x.max()).days),
-            Frequency=("Invoice", "nunique"),
-            Monetary=("Revenue", "sum"),
-        )
-        .reset_index()
-    )
-
-    # R/F/M scores (1–5)
-    customer_stats["R_Score"] = pd.qcut(
-        customer_stats["Recency"], 5, labels=[5, 4, 3, 2, 1]
-    ).astype(int)
-
-    customer_stats["F_Score"] = pd.qcut(
-        customer_stats["Frequency"].rank(method="first"), 5, labels=[1, 2, 3, 4, 5]
-    ).astype(int)
-
-    customer_stats["M_Score"] = pd.qcut(
-        customer_stats["Monetary"], 5, labels=[1, 2, 3, 4, 5]
-    ).astype(int)
-
-    # Segment rules (not equal-sized → realistic)
-    def rfm_segment(row):
-        r, f, m = row["R_Score"], row["F_Score"], row["M_Score"]
-        if (r >= 4) and (f >= 4) and (m >= 4):
-            return "Champions"
-        if (r >= 3) and (f >= 4) and (m >= 3):
-            return "Loyal Customers"
-        if (r >= 4) and (f <= 2):
-            return "New Customers"
-        if (r == 3) and (f >= 3) and (m >= 3):
-            return "Potential Loyalists"
-        if (r <= 2) and (f >= 3):
-            return "At Risk"
-        if (r <= 2) and (f <= 2):
-            return "Lost"
-        return "Need Attention"
-
-    customer_stats["Segment"] = customer_stats.apply(rfm_segment, axis=1)
-
-    # Keep the rest of your plotting logic the same (Customers + Revenue)
-    segment_summary = customer_stats.groupby("Segment").agg({
-        "Customer ID": "count",
-        "Monetary": "sum"
-    }).reset_index()
-    segment_summary.columns = ["Segment", "Customers", "Revenue"]
-
     col1, col2 = st.columns(2)
 
     with col1:
@@ -312,7 +451,7 @@ def render_customer_segments(df: pd.DataFrame):
 
 
 
-def render_time_patterns(df: pd.DataFrame, metrics: dict):
+def render_time_patterns(metrics: dict):
     """Render time-based patterns."""
     st.subheader("⏰ Sales Patterns")
     
@@ -346,7 +485,8 @@ def render_time_patterns(df: pd.DataFrame, metrics: dict):
             x='Hour',
             y='Revenue',
             title='Revenue by Hour of Day',
-            markers=True
+            markers=True,
+            render_mode='webgl'
         )
         fig.update_traces(line_color='#ff7f0e')
         fig.update_layout(height=350)
@@ -360,58 +500,14 @@ def render_time_patterns(df: pd.DataFrame, metrics: dict):
     </div>
     """, unsafe_allow_html=True)
 
-def render_cohort_retention(df: pd.DataFrame):
+def render_cohort_retention(retention_pct: pd.DataFrame):
     """Render cohort retention heatmap (monthly)."""
     st.subheader("🧊 Cohort Retention (Monthly)")
 
-    d = df.copy()
-    d["InvoiceDate"] = pd.to_datetime(d["InvoiceDate"], errors="coerce")
-    d = d.dropna(subset=["Customer ID", "InvoiceDate"])
-
-    # Cohort month = first purchase month per customer
-    first_purchase = (
-        d.groupby("Customer ID")["InvoiceDate"]
-        .min()
-        .reset_index()
-        .rename(columns={"InvoiceDate": "CohortDate"})
-    )
-    first_purchase["Cohort"] = first_purchase["CohortDate"].dt.to_period("M")
-
-    d["TransactionMonth"] = d["InvoiceDate"].dt.to_period("M")
-    d = d.merge(first_purchase[["Customer ID", "Cohort"]], on="Customer ID", how="left")
-
-    # Months since first purchase
-    d["CohortAge"] = (d["TransactionMonth"] - d["Cohort"]).apply(lambda x: x.n)
-
-    # Count active customers by cohort + age
-    cohort_counts = (
-        d.groupby(["Cohort", "CohortAge"])["Customer ID"]
-        .nunique()
-        .reset_index(name="Customers")
-    )
-
-    # Pivot to matrix
-    retention_matrix = (
-        cohort_counts.pivot(index="Cohort", columns="CohortAge", values="Customers")
-        .fillna(0)
-        .sort_index()
-    )
-
-    # Convert to retention % (divide by month 0)
-    if 0 not in retention_matrix.columns:
+    if retention_pct is None:
         st.info("Not enough data to compute cohort retention (missing cohort month 0).")
         return
 
-    cohort_size = retention_matrix[0].replace(0, pd.NA)
-    retention_pct = (retention_matrix.divide(cohort_size, axis=0) * 100).fillna(0).round(1)
-
-    # Keep first N months so the chart stays readable
-    max_months = min(12, retention_pct.shape[1])
-    retention_pct = retention_pct.iloc[:, :max_months]
-
-    # Make labels nicer
-    retention_pct.index = retention_pct.index.astype(str)
-
     # Quick KPI
     avg_m1 = float(retention_pct[1].mean()) if 1 in retention_pct.columns else 0.0
     c1, c2, c3 = st.columns(3)
@@ -419,31 +515,36 @@ def render_cohort_retention(df: pd.DataFrame):
     c2.metric("Months tracked", int(retention_pct.shape[1] - 1))
     c3.metric("Avg Month-1 Retention", f"{avg_m1:.1f}%")
 
-    # Heatmap
-    fig = px.imshow(
-        retention_pct,
-        text_auto=True,
-        aspect="auto",
-        labels=dict(x="Months Since First Purchase", y="Cohort (First Purchase Month)", color="Retention %"),
-        title="Customer Retention by Cohort (%)"
+    # Heatmap (drawn as one image; per-cell text labels are only added for
+    # small matrices, since each one is a separate SVG element)
+    heatmap = go.Heatmap(
+        z=retention_pct.to_numpy(),
+        x=retention_pct.columns,
+        y=retention_pct.index,
+        colorscale="Blues",
+        colorbar=dict(title="Retention %"),
+        hovertemplate="Cohort: %{y}<br>Month: %{x}<br>Retention: %{z}%<extra></extra>"
+    )
+    if retention_pct.size <= 144:
+        heatmap.texttemplate = "%{z}"
+    
+    fig = go.Figure(heatmap)
+    fig.update_layout(
+        title="Customer Retention by Cohort (%)",
+        xaxis_title="Months Since First Purchase",
+        yaxis_title="Cohort (First Purchase Month)",
+        yaxis_autorange="reversed",
+        height=520
     )
-    fig.update_layout(height=520)
     st.plotly_chart(fig, use_container_width=True)
 
     st.caption("Retention = % of customers in each cohort who purchased again after N months.")
 
 
-def render_top_products(df: pd.DataFrame):
+def render_top_products(product_stats: pd.DataFrame):
     """Render top products analysis."""
     st.subheader("🏆 Top Products")
     
-    product_stats = df.groupby(['StockCode', 'Description']).agg({
-        'Revenue': 'sum',
-        'Quantity': 'sum',
-        'Invoice': 'nunique'
-    }).reset_index()
-    product_stats = product_stats.sort_values('Revenue', ascending=False).head(10)
-    
     fig = px.bar(
         product_stats,
         x='Revenue',
@@ -464,12 +565,18 @@ def render_top_products(df: pd.DataFrame):
 
 
 def render_sidebar_filters(df: pd.DataFrame):
-    """Render sidebar filters."""
+    """
+    Render sidebar filters.
+    
+    Returns:
+        Tuple of (date_start, date_end, country); dates are None when no
+        complete range is selected
+    """
     st.sidebar.header("🎛️ Filters")
     
-    # Date range
-    min_date = df['InvoiceDate'].min().date()
-    max_date = df['InvoiceDate'].max().date()
+    # Date range (df is sorted by InvoiceDate, so the ends are the bounds)
+    min_date = df['InvoiceDate'].iloc[0].date()
+    max_date = df['InvoiceDate'].iloc[-1].date()
     
     date_range = st.sidebar.date_input(
         "Date Range",
@@ -479,29 +586,25 @@ def render_sidebar_filters(df: pd.DataFrame):
     )
     
     # Country filter
-    countries = ['All'] + sorted(df['Country'].unique().tolist())
+    # Country is categorical and get_data dropped categories without rows
+    countries = ['All'] + sorted(df['Country'].cat.categories.tolist())
     selected_country = st.sidebar.selectbox("Country", countries)
     
-    # Apply filters
-    filtered_df = df.copy()
-    
     if len(date_range) == 2:
-        filtered_df = filtered_df[
-            (filtered_df['InvoiceDate'].dt.date >= date_range[0]) &
-            (filtered_df['InvoiceDate'].dt.date <= date_range[1])
-        ]
+        date_start, date_end = date_range
+    else:
+        date_start, date_end = None, None
     
-    if selected_country != 'All':
-        filtered_df = filtered_df[filtered_df['Country'] == selected_country]
-    
-    # Show filter summary
+    return date_start, date_end, selected_country
+
+
+def render_filter_summary(summary: dict):
+    """Render the sidebar summary of the filtered data."""
     st.sidebar.markdown("---")
     st.sidebar.markdown(f"**Filtered Data:**")
-    st.sidebar.markdown(f"• {len(filtered_df):,} transactions")
-    st.sidebar.markdown(f"• {filtered_df['Customer ID'].nunique():,} customers")
-    st.sidebar.markdown(f"• {format_currency(filtered_df['Revenue'].sum())} revenue")
-    
-    return filtered_df
+    st.sidebar.markdown(f"• {summary['transactions']:,} transactions")
+    st.sidebar.markdown(f"• {summary['customers']:,} customers")
+    st.sidebar.markdown(f"• {format_currency(summary['revenue'])} revenue")
 
 
 def main():
@@ -516,43 +619,40 @@ def main():
     df = get_data()
     
     # Apply filters
-    filtered_df = render_sidebar_filters(df)
-    
-    # Calculate metrics
-    metrics = {
-        'revenue': calculate_revenue_metrics(filtered_df),
-        'customers': calculate_customer_metrics(filtered_df),
-        'geographic': calculate_geographic_metrics(filtered_df),
-        'time': calculate_time_metrics(filtered_df)
-    }
+    filters = render_sidebar_filters(df)
+    render_filter_summary(compute_filter_summary(*filters))
+    
+    # Calculate metrics (cached per filter selection)
+    metrics = compute_metrics(*filters)
     
     # Render dashboard sections
     render_kpi_cards(metrics)
     
     st.markdown("---")
     
-    # Main charts
-    render_revenue_trend(filtered_df)
-    
-    st.markdown("---")
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        render_customer_segments(filtered_df)
-    with col2:
-        render_top_products(filtered_df)
-    
-    st.markdown("---")
-    
-    render_geographic_analysis(filtered_df, metrics)
-    
-    st.markdown("---")
+    # Only the selected section is computed and drawn. st.tabs would run
+    # every tab body on each rerun, so a horizontal radio is used instead.
+    section = st.radio(
+        "Section",
+        ["Revenue", "Segments & Products", "Geography", "Time Patterns", "Cohorts"],
+        horizontal=True,
+        label_visibility="collapsed"
+    )
     
-    render_time_patterns(filtered_df, metrics)
-
-    st.markdown("---")
-    render_cohort_retention(filtered_df)
-
+    if section == "Revenue":
+        render_revenue_trend(compute_monthly_revenue(*filters))
+    elif section == "Segments & Products":
+        col1, col2 = st.columns(2)
+        with col1:
+            render_customer_segments(compute_segment_summary(*filters))
+        with col2:
+            render_top_products(compute_top_products(*filters))
+    elif section == "Geography":
+        render_geographic_analysis(metrics)
+    elif section == "Time Patterns":
+        render_time_patterns(metrics)
+    else:
+        render_cohort_retention(compute_cohort_retention(*filters))
     
     # Footer
     st.markdown("---")
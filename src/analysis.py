@@ -13,30 +13,15 @@ from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_loader import load_data
+from metrics import rank_score
+from preprocessing import segment_rfm
+
 # Set style
 plt.style.use('seaborn-v0_8-whitegrid')
 sns.set_palette('husl')
 
 
-def load_data():
-    """Load processed data."""
-    project_root = Path(__file__).parent.parent
-    
-    # Try processed data first, fall back to sample
-    processed_file = project_root / 'data' / 'processed' / 'cleaned_transactions.csv'
-    sample_file = project_root / 'data' / 'sample' / 'sample_data.csv'
-    
-    if processed_file.exists():
-        df = pd.read_csv(processed_file)
-    elif sample_file.exists():
-        df = pd.read_csv(sample_file)
-    else:
-        raise FileNotFoundError("No data found. Run preprocessing first.")
-    
-    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-    return df
-
-
 def create_monthly_revenue_chart(df, save_path):
     """Create and save monthly revenue trend chart."""
     monthly = df.groupby(df['InvoiceDate'].dt.to_period('M'))['Revenue'].sum().reset_index()
@@ -54,9 +39,10 @@ def create_monthly_revenue_chart(df, save_path):
     ax.set_title('Monthly Revenue Trend', fontsize=14, fontweight='bold')
     
     # Add annotation for peak
-    peak_idx = monthly['Revenue'].idxmax()
-    peak_value = monthly.loc[peak_idx, 'Revenue']
-    peak_month = monthly.loc[peak_idx, 'InvoiceDate']
+    revenue = monthly['Revenue'].to_numpy()
+    peak_idx = int(revenue.argmax())
+    peak_value = revenue[peak_idx]
+    peak_month = monthly['InvoiceDate'].iat[peak_idx]
     ax.annotate(f'Peak: £{peak_value:,.0f}\n({peak_month})', 
                 xy=(peak_idx, peak_value),
                 xytext=(peak_idx - 2, peak_value * 1.1),
@@ -73,34 +59,22 @@ def create_customer_segments_chart(df, save_path):
     """Create and save customer segmentation chart using proper RFM scoring."""
     reference_date = df['InvoiceDate'].max() + pd.Timedelta(days=1)
 
-    customer_stats = df.groupby('Customer ID').agg(
-        Recency=('InvoiceDate', lambda x: (reference_date - x.max()).days),
+    customer_stats = df.groupby('Customer ID', observed=True).agg(
+        LastPurchase=('InvoiceDate', 'max'),
         Frequency=('Invoice', 'nunique'),
         Monetary=('Revenue', 'sum')
     ).reset_index()
+    customer_stats.insert(1, 'Recency', (reference_date - customer_stats.pop('LastPurchase')).dt.days)
 
     customer_stats['R_Score'] = pd.qcut(customer_stats['Recency'], q=5, labels=[5,4,3,2,1])
-    customer_stats['F_Score'] = pd.qcut(customer_stats['Frequency'].rank(method='first'), q=5, labels=[1,2,3,4,5])
-    customer_stats['M_Score'] = pd.qcut(customer_stats['Monetary'].rank(method='first'), q=5, labels=[1,2,3,4,5])
-
-    def segment_customer(row):
-        r, f, m = int(row['R_Score']), int(row['F_Score']), int(row['M_Score'])
-        if r >= 4 and f >= 4 and m >= 4:
-            return 'Champions'
-        elif r >= 3 and f >= 3 and m >= 3:
-            return 'Loyal Customers'
-        elif r >= 4 and f <= 2:
-            return 'New Customers'
-        elif r <= 2 and f >= 3 and m >= 3:
-            return 'At Risk'
-        elif r <= 2 and f <= 2:
-            return 'Lost'
-        else:
-            return 'Potential Loyalists'
+    customer_stats['F_Score'] = rank_score(customer_stats['Frequency'].to_numpy())
+    customer_stats['M_Score'] = rank_score(customer_stats['Monetary'].to_numpy())
 
-    customer_stats['Segment'] = customer_stats.apply(segment_customer, axis=1)
+    customer_stats['Segment'] = segment_rfm(
+        customer_stats['R_Score'], customer_stats['F_Score'], customer_stats['M_Score']
+    )
 
-    segment_summary = customer_stats.groupby('Segment').agg(
+    segment_summary = customer_stats.groupby('Segment', observed=True).agg(
         Customers=('Customer ID', 'count'),
         Revenue=('Monetary', 'sum')
     ).reset_index()
@@ -131,7 +105,7 @@ def create_customer_segments_chart(df, save_path):
 
 def create_geographic_chart(df, save_path):
     """Create and save geographic distribution chart."""
-    country_stats = df.groupby('Country')['Revenue'].sum().reset_index()
+    country_stats = df.groupby('Country', observed=True)['Revenue'].sum().reset_index()
     country_stats = country_stats.sort_values('Revenue', ascending=True)
     
     # Top 10
@@ -162,7 +136,7 @@ def create_time_patterns_chart(df, save_path):
     
     # Day of week
     day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    dow_stats = df.groupby('DayOfWeek')['Revenue'].sum().reset_index()
+    dow_stats = df.groupby('DayOfWeek', observed=True)['Revenue'].sum().reset_index()
     dow_stats['DayName'] = dow_stats['DayOfWeek'].apply(lambda x: day_names[x])
     
     colors = plt.cm.Blues(np.linspace(0.3, 0.9, 7))
@@ -173,7 +147,7 @@ def create_time_patterns_chart(df, save_path):
     axes[0].tick_params(axis='x', rotation=45)
     
     # Hour of day
-    hour_stats = df.groupby('Hour')['Revenue'].sum().reset_index()
+    hour_stats = df.groupby('Hour', observed=True)['Revenue'].sum().reset_index()
     axes[1].plot(hour_stats['Hour'], hour_stats['Revenue'], marker='o', color='#ff7f0e', linewidth=2)
     axes[1].fill_between(hour_stats['Hour'], hour_stats['Revenue'], alpha=0.3, color='#ff7f0e')
     axes[1].set_xlabel('Hour of Day', fontsize=12)
@@ -194,7 +168,7 @@ def generate_summary_report(df, segment_summary):
     total_orders = df['Invoice'].nunique()
     
     # Top 20% analysis
-    customer_revenue = df.groupby('Customer ID')['Revenue'].sum().sort_values(ascending=False)
+    customer_revenue = df.groupby('Customer ID', observed=True)['Revenue'].sum().sort_values(ascending=False)
     top_20_count = int(len(customer_revenue) * 0.2)
     top_20_revenue = customer_revenue.head(top_20_count).sum()
     
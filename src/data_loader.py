@@ -15,6 +15,65 @@ def get_project_root() -> Path:
     return Path(__file__).parent.parent
 
 
+def apply_column_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store low-cardinality text columns as categoricals, Customer ID as UInt32,
+    Quantity as int32 and the date parts as small unsigned integers.
+    
+    Groupbys and unique counts on these columns then work on integer codes
+    instead of hashing Python strings. Price and Revenue stay float64 so
+    revenue totals remain exact to the penny.
+    """
+    return df.astype({
+        'Country': 'category',
+        'StockCode': 'category',
+        'Description': 'category',
+        'Invoice': 'category',
+        'Customer ID': 'UInt32',
+        'Quantity': 'int32',
+        'Year': 'uint16',
+        'Month': 'uint8',
+        'DayOfWeek': 'uint8',
+        'Hour': 'uint8'
+    })
+
+
+def get_processed_path(name: str) -> Path:
+    """
+    Resolve a processed dataset by name, preferring Parquet over CSV.
+    
+    The CSV is used when there is no Parquet file, or when it is newer
+    than the Parquet file (e.g. the pipeline rewrote it after a sample run).
+    
+    Args:
+        name: File name without extension (e.g. 'cleaned_transactions')
+        
+    Returns:
+        Path to the file to read
+    """
+    processed_path = get_project_root() / 'data' / 'processed'
+    parquet_file = processed_path / f'{name}.parquet'
+    csv_file = processed_path / f'{name}.csv'
+    
+    if parquet_file.exists() and (
+        not csv_file.exists() or parquet_file.stat().st_mtime >= csv_file.stat().st_mtime
+    ):
+        return parquet_file
+    return csv_file
+
+
+def read_processed(path: Path, parse_dates: Optional[list] = None) -> pd.DataFrame:
+    """
+    Read a processed dataset from Parquet or CSV.
+    
+    Parquet files keep their stored dtypes; for CSV files the columns in
+    parse_dates are parsed as datetimes while reading.
+    """
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path, engine='pyarrow')
+    return pd.read_csv(path, parse_dates=parse_dates)
+
+
 def load_processed_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Load processed transaction data and RFM data.
@@ -22,17 +81,13 @@ def load_processed_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
     Returns:
         Tuple of (transactions_df, rfm_df)
     """
-    project_root = get_project_root()
-    processed_path = project_root / 'data' / 'processed'
-    
-    transactions = pd.read_csv(processed_path / 'cleaned_transactions.csv')
-    rfm = pd.read_csv(processed_path / 'customer_rfm.csv')
+    transactions = read_processed(get_processed_path('cleaned_transactions'), parse_dates=['InvoiceDate'])
+    rfm = read_processed(get_processed_path('customer_rfm'))
     
     # Convert date columns
-    transactions['InvoiceDate'] = pd.to_datetime(transactions['InvoiceDate'])
     transactions['YearMonth'] = pd.to_datetime(transactions['YearMonth'].astype(str))
     
-    return transactions, rfm
+    return apply_column_dtypes(transactions), rfm
 
 
 def load_sample_data() -> pd.DataFrame:
@@ -51,10 +106,9 @@ def load_sample_data() -> pd.DataFrame:
             "Run preprocessing first: python src/preprocessing.py"
         )
     
-    df = pd.read_csv(sample_path)
-    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    df = pd.read_csv(sample_path, parse_dates=['InvoiceDate'])
     
-    return df
+    return apply_column_dtypes(df)
 
 
 def load_data(use_sample: bool = False) -> pd.DataFrame:
@@ -72,12 +126,11 @@ def load_data(use_sample: bool = False) -> pd.DataFrame:
     if use_sample:
         return load_sample_data()
     
-    processed_file = project_root / 'data' / 'processed' / 'cleaned_transactions.csv'
+    processed_file = get_processed_path('cleaned_transactions')
     
     if processed_file.exists():
-        df = pd.read_csv(processed_file)
-        df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-        return df
+        df = read_processed(processed_file, parse_dates=['InvoiceDate'])
+        return apply_column_dtypes(df)
     else:
         print("⚠️ Processed data not found. Loading sample data instead.")
         return load_sample_data()
@@ -91,11 +144,12 @@ def check_data_availability() -> dict:
         Dictionary with availability status for each data source
     """
     project_root = get_project_root()
+    raw_path = project_root / 'data' / 'raw'
     
     return {
-        'raw': (project_root / 'data' / 'raw' / 'online_retail_II.xlsx').exists(),
-        'processed': (project_root / 'data' / 'processed' / 'cleaned_transactions.csv').exists(),
-        'rfm': (project_root / 'data' / 'processed' / 'customer_rfm.csv').exists(),
+        'raw': (raw_path / 'online_retail_II.parquet').exists() or (raw_path / 'online_retail_II.xlsx').exists(),
+        'processed': get_processed_path('cleaned_transactions').exists(),
+        'rfm': get_processed_path('customer_rfm').exists(),
         'sample': (project_root / 'data' / 'sample' / 'sample_data.csv').exists()
     }
 
@@ -0,0 +1,112 @@
+"""
+Raw Data Ingest Module
+Converts the Online Retail II Excel workbook to Parquet once, so later
+preprocessing runs read columnar data instead of re-parsing the workbook.
+"""
+
+import warnings
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+from pathlib import Path
+
+
+SHEETS = ['Year 2009-2010', 'Year 2010-2011']
+
+# Invoice and StockCode mix numbers and text in the workbook, so they are
+# stored as strings; Customer ID stays float because it has missing values.
+RAW_SCHEMA = pa.schema([
+    ('Invoice', pa.string()),
+    ('StockCode', pa.string()),
+    ('Description', pa.string()),
+    ('Quantity', pa.int64()),
+    ('InvoiceDate', pa.timestamp('ns')),
+    ('Price', pa.float64()),
+    ('Customer ID', pa.float64()),
+    ('Country', pa.string())
+])
+
+STRING_COLUMNS = {'Invoice', 'StockCode', 'Description', 'Country'}
+
+
+def build_batch(rows: list, columns: list) -> pa.RecordBatch:
+    """
+    Build a record batch from worksheet rows.
+    
+    Args:
+        rows: Row value tuples in worksheet column order
+        columns: Stripped header names for the worksheet columns
+    
+    Returns:
+        RecordBatch matching RAW_SCHEMA
+    """
+    values = dict(zip(columns, zip(*rows)))
+    arrays = []
+    for field in RAW_SCHEMA:
+        column = values[field.name]
+        if field.name in STRING_COLUMNS:
+            column = [None if v is None else str(v) for v in column]
+        arrays.append(pa.array(column, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=RAW_SCHEMA)
+
+
+def convert_excel_to_parquet(excel_path: Path, parquet_path: Path, batch_size: int = 65536) -> int:
+    """
+    Stream both workbook sheets into a single Parquet file.
+    
+    The workbook is opened read-only and rows are written in batches, so the
+    whole sheet is never held in memory as Python objects.
+    
+    Args:
+        excel_path: Path to online_retail_II.xlsx
+        parquet_path: Output Parquet path
+        batch_size: Rows per record batch
+    
+    Returns:
+        Number of rows written
+    """
+    print(f"📦 Converting {excel_path} to Parquet...")
+    
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='Workbook contains no default style', category=UserWarning)
+        workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    total_rows = 0
+    
+    try:
+        with pq.ParquetWriter(parquet_path, RAW_SCHEMA, compression='zstd') as writer:
+            for sheet_name in SHEETS:
+                rows = workbook[sheet_name].iter_rows(values_only=True)
+                columns = [str(name).strip() for name in next(rows)]
+    
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        writer.write_batch(build_batch(batch, columns))
+                        total_rows += len(batch)
+                        batch = []
+                if batch:
+                    writer.write_batch(build_batch(batch, columns))
+                    total_rows += len(batch)
+    finally:
+        workbook.close()
+    
+    print(f"   Wrote {total_rows:,} rows to {parquet_path}")
+    return total_rows
+
+
+def main():
+    """Convert data/raw/online_retail_II.xlsx to Parquet."""
+    raw_path = Path(__file__).parent.parent / 'data' / 'raw'
+    excel_path = raw_path / 'online_retail_II.xlsx'
+    
+    if not excel_path.exists():
+        print(f"⚠️  Raw data not found at {excel_path}")
+        return
+    
+    convert_excel_to_parquet(excel_path, raw_path / 'online_retail_II.parquet')
+    print("\n✅ Ingest complete!")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,18 +5,51 @@ KPI calculations and business metrics for the e-commerce dashboard.
 
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 
-def calculate_revenue_metrics(df: pd.DataFrame) -> Dict:
+def aggregate_orders(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Roll transactions up to one row per invoice.
+    
+    An invoice belongs to a single customer and country and is placed at one
+    timestamp, so those columns are carried over from its first line, while
+    Revenue and Quantity are summed. Order counts then become plain row counts
+    on this much smaller table instead of per-group nunique over transactions.
+    
+    Args:
+        df: Transactions with Invoice, Customer ID, Country, InvoiceDate,
+            YearMonth, DayOfWeek, Hour, Revenue and Quantity columns
+        
+    Returns:
+        DataFrame with one row per invoice
+    """
+    # First line of each invoice, in order of appearance
+    orders = df.loc[
+        ~df['Invoice'].duplicated().to_numpy(),
+        ['Invoice', 'Customer ID', 'Country', 'InvoiceDate', 'YearMonth', 'DayOfWeek', 'Hour']
+    ].reset_index(drop=True)
+    
+    # sort=False keeps groups in the same order of appearance
+    totals = df.groupby('Invoice', observed=True, sort=False)[['Revenue', 'Quantity']].sum()
+    orders['Revenue'] = totals['Revenue'].to_numpy()
+    orders['Quantity'] = totals['Quantity'].to_numpy()
+    
+    return orders
+
+
+def calculate_revenue_metrics(df: pd.DataFrame, orders: Optional[pd.DataFrame] = None) -> Dict:
     """Calculate revenue-related KPIs."""
+    if orders is None:
+        orders = aggregate_orders(df)
     
-    total_revenue = df['Revenue'].sum()
+    total_revenue = orders['Revenue'].sum()
     
     # Monthly metrics
-    monthly = df.groupby('YearMonth').agg({
+    monthly = orders.groupby('YearMonth', observed=True).agg({
         'Revenue': 'sum',
-        'Invoice': 'nunique',
+        'Invoice': 'count',
         'Customer ID': 'nunique'
     }).reset_index()
     monthly.columns = ['YearMonth', 'Revenue', 'Orders', 'Customers']
@@ -36,27 +69,30 @@ def calculate_revenue_metrics(df: pd.DataFrame) -> Dict:
     }
 
 
-def calculate_customer_metrics(df: pd.DataFrame) -> Dict:
+def calculate_customer_metrics(df: pd.DataFrame, orders: Optional[pd.DataFrame] = None) -> Dict:
     """Calculate customer-related KPIs."""
+    if orders is None:
+        orders = aggregate_orders(df)
     
     # Customer aggregates
-    customer_stats = df.groupby('Customer ID').agg({
+    customer_stats = orders.groupby('Customer ID', observed=True).agg({
         'Revenue': 'sum',
-        'Invoice': 'nunique',
+        'Invoice': 'count',
         'InvoiceDate': ['min', 'max']
     })
     customer_stats.columns = ['TotalSpend', 'OrderCount', 'FirstPurchase', 'LastPurchase']
     customer_stats = customer_stats.reset_index()
     
     # Customer tenure
-    customer_stats['TenureDays'] = (customer_stats['LastPurchase'] - customer_stats['FirstPurchase']).dt.days
+    tenure = customer_stats['LastPurchase'].to_numpy() - customer_stats['FirstPurchase'].to_numpy()
+    customer_stats['TenureDays'] = tenure // np.timedelta64(1, 'D')
     
     # Repeat customers
     repeat_customers = (customer_stats['OrderCount'] > 1).sum()
     total_customers = len(customer_stats)
     
     # Average order value per customer
-    customer_stats['AOV'] = customer_stats['TotalSpend'] / customer_stats['OrderCount']
+    customer_stats['AOV'] = customer_stats['TotalSpend'].to_numpy() / customer_stats['OrderCount'].to_numpy()
     # True order-level AOV (not per-customer average)
 
     return {
@@ -66,7 +102,7 @@ def calculate_customer_metrics(df: pd.DataFrame) -> Dict:
         'avg_customer_value': customer_stats['TotalSpend'].mean(),
         'median_customer_value': customer_stats['TotalSpend'].median(),
         'avg_orders_per_customer': customer_stats['OrderCount'].mean(),
-        'avg_aov': df.groupby('Invoice')['Revenue'].sum().mean(),
+        'avg_aov': orders['Revenue'].mean(),
         'customer_data': customer_stats
     }
 
@@ -74,14 +110,20 @@ def calculate_customer_metrics(df: pd.DataFrame) -> Dict:
 def calculate_product_metrics(df: pd.DataFrame) -> Dict:
     """Calculate product-related KPIs."""
     
-    # Product performance
-    product_stats = df.groupby(['StockCode', 'Description']).agg({
+    # Product performance, keyed on StockCode alone
+    product_stats = df.groupby('StockCode', observed=True).agg({
         'Revenue': 'sum',
         'Quantity': 'sum',
         'Invoice': 'nunique',
         'Customer ID': 'nunique'
     }).reset_index()
-    product_stats.columns = ['StockCode', 'Description', 'Revenue', 'Quantity', 'Orders', 'Customers']
+    product_stats.columns = ['StockCode', 'Revenue', 'Quantity', 'Orders', 'Customers']
+    
+    # Label each product with the first description it appears under
+    descriptions = df.loc[~df['StockCode'].duplicated().to_numpy(), ['StockCode', 'Description']]
+    product_stats = product_stats.merge(descriptions, on='StockCode', how='left')[
+        ['StockCode', 'Description', 'Revenue', 'Quantity', 'Orders', 'Customers']
+    ]
     product_stats = product_stats.sort_values('Revenue', ascending=False)
     
     # Top products
@@ -97,13 +139,15 @@ def calculate_product_metrics(df: pd.DataFrame) -> Dict:
     }
 
 
-def calculate_geographic_metrics(df: pd.DataFrame) -> Dict:
+def calculate_geographic_metrics(df: pd.DataFrame, orders: Optional[pd.DataFrame] = None) -> Dict:
     """Calculate geographic KPIs."""
+    if orders is None:
+        orders = aggregate_orders(df)
     
     # Country performance
-    country_stats = df.groupby('Country').agg({
+    country_stats = orders.groupby('Country', observed=True).agg({
         'Revenue': 'sum',
-        'Invoice': 'nunique',
+        'Invoice': 'count',
         'Customer ID': 'nunique',
         'Quantity': 'sum'
     }).reset_index()
@@ -112,7 +156,7 @@ def calculate_geographic_metrics(df: pd.DataFrame) -> Dict:
     
     # Market share
     total_revenue = country_stats['Revenue'].sum()
-    country_stats['MarketShare'] = country_stats['Revenue'] / total_revenue * 100
+    country_stats['MarketShare'] = country_stats['Revenue'].to_numpy() / total_revenue * 100
     
     # UK vs International
     uk_revenue = country_stats[country_stats['Country'] == 'United Kingdom']['Revenue'].sum()
@@ -128,24 +172,27 @@ def calculate_geographic_metrics(df: pd.DataFrame) -> Dict:
     }
 
 
-def calculate_time_metrics(df: pd.DataFrame) -> Dict:
+def calculate_time_metrics(df: pd.DataFrame, orders: Optional[pd.DataFrame] = None) -> Dict:
     """Calculate time-based patterns."""
+    if orders is None:
+        orders = aggregate_orders(df)
     
-    # Day of week analysis
-    dow_stats = df.groupby('DayOfWeek').agg({
+    # Single pass over (day, hour) cells. Each invoice has one timestamp, so
+    # per-cell invoice counts add up exactly to per-day and per-hour counts.
+    cells = orders.groupby(['DayOfWeek', 'Hour'], observed=True).agg({
         'Revenue': 'sum',
-        'Invoice': 'nunique'
-    }).reset_index()
+        'Invoice': 'count'
+    })
+    
+    # Day of week analysis
+    dow_stats = cells.groupby(level='DayOfWeek').sum().reset_index()
     dow_stats['DayName'] = dow_stats['DayOfWeek'].map({
         0: 'Monday', 1: 'Tuesday', 2: 'Wednesday', 
         3: 'Thursday', 4: 'Friday', 5: 'Saturday', 6: 'Sunday'
     })
     
     # Hour analysis
-    hour_stats = df.groupby('Hour').agg({
-        'Revenue': 'sum',
-        'Invoice': 'nunique'
-    }).reset_index()
+    hour_stats = cells.groupby(level='Hour').sum().reset_index()
     
     # Peak times
     peak_day = dow_stats.loc[dow_stats['Revenue'].idxmax(), 'DayName']
@@ -159,23 +206,20 @@ def calculate_time_metrics(df: pd.DataFrame) -> Dict:
     }
 
 
-def calculate_yoy_growth(df: pd.DataFrame) -> Dict:
+def calculate_yoy_growth(df: pd.DataFrame, orders: Optional[pd.DataFrame] = None) -> Dict:
     """Calculate year-over-year growth metrics."""
+    if orders is None:
+        orders = aggregate_orders(df)
     
-    # Filter to comparable periods (same months in both years)
-    df_2010 = df[df['InvoiceDate'].dt.year == 2010]
-    df_2011 = df[df['InvoiceDate'].dt.year == 2011]
-    
-    # Only compare overlapping months
-    months_2010 = set(df_2010['Month'].unique())
-    months_2011 = set(df_2011['Month'].unique())
-    common_months = months_2010.intersection(months_2011)
+    # Revenue per calendar month (rows) and year (columns), from the invoice table
+    dates = orders['InvoiceDate'].dt
+    monthly = orders.groupby([dates.month.rename('Month'), dates.year.rename('Year')])['Revenue'].sum().unstack()
     
-    df_2010_comparable = df_2010[df_2010['Month'].isin(common_months)]
-    df_2011_comparable = df_2011[df_2011['Month'].isin(common_months)]
+    # Only compare months present in both years
+    comparable = monthly.reindex(columns=[2010, 2011]).dropna()
     
-    revenue_2010 = df_2010_comparable['Revenue'].sum()
-    revenue_2011 = df_2011_comparable['Revenue'].sum()
+    revenue_2010 = comparable[2010].sum()
+    revenue_2011 = comparable[2011].sum()
     
     yoy_growth = (revenue_2011 - revenue_2010) / revenue_2010 * 100 if revenue_2010 > 0 else 0
     
@@ -183,23 +227,111 @@ def calculate_yoy_growth(df: pd.DataFrame) -> Dict:
         'revenue_2010': revenue_2010,
         'revenue_2011': revenue_2011,
         'yoy_growth': yoy_growth,
-        'comparable_months': len(common_months)
+        'comparable_months': len(comparable)
     }
 
 
-def get_all_metrics(df: pd.DataFrame) -> Dict:
-    """Calculate all metrics and return as a single dictionary."""
+def calculate_dashboard_metrics(df: pd.DataFrame) -> Dict:
+    """
+    Calculate the revenue, customer, geographic and time KPIs together.
+    
+    The transactions are scanned once to build the invoice table, and all
+    four metric groups are aggregated from it.
+    """
+    orders = aggregate_orders(df)
     
     return {
-        'revenue': calculate_revenue_metrics(df),
-        'customers': calculate_customer_metrics(df),
-        'products': calculate_product_metrics(df),
-        'geographic': calculate_geographic_metrics(df),
-        'time': calculate_time_metrics(df),
-        'yoy': calculate_yoy_growth(df)
+        'revenue': calculate_revenue_metrics(df, orders),
+        'customers': calculate_customer_metrics(df, orders),
+        'geographic': calculate_geographic_metrics(df, orders),
+        'time': calculate_time_metrics(df, orders)
     }
 
 
+def get_all_metrics(df: pd.DataFrame) -> Dict:
+    """
+    Calculate all metrics and return as a single dictionary.
+    
+    The metric groups only read their inputs, so they run in a thread pool;
+    pandas releases the GIL inside its groupby aggregations, letting the
+    scans overlap.
+    """
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        # Products need line-level rows per StockCode, so they can start
+        # while the invoice table for the other groups is being built
+        products = executor.submit(calculate_product_metrics, df)
+        orders = aggregate_orders(df)
+        
+        futures = {
+            'revenue': executor.submit(calculate_revenue_metrics, df, orders),
+            'customers': executor.submit(calculate_customer_metrics, df, orders),
+            'products': products,
+            'geographic': executor.submit(calculate_geographic_metrics, df, orders),
+            'time': executor.submit(calculate_time_metrics, df, orders),
+            'yoy': executor.submit(calculate_yoy_growth, df, orders)
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def sum_by(keys: pd.Series, values: pd.Series) -> pd.Series:
+    """
+    Sum values per distinct key, like keys.groupby(keys).sum() on values.
+    
+    The keys are factorized once and the values summed with np.bincount,
+    skipping groupby's general aggregation machinery for a single sum.
+    
+    Args:
+        keys: Group labels; missing labels are dropped
+        values: Numeric values aligned with keys
+        
+    Returns:
+        Series of sums indexed by the sorted distinct keys
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    valid = codes >= 0
+    totals = np.bincount(codes[valid], weights=values.to_numpy()[valid], minlength=len(uniques))
+    return pd.Series(totals, index=pd.Index(uniques, name=keys.name), name=values.name)
+
+
+def quantile_score(values: np.ndarray, n_bins: int = 5) -> np.ndarray:
+    """
+    Score values 1..n_bins by quantile bucket.
+    
+    Equivalent to pd.qcut(values, n_bins, labels=range(1, n_bins + 1)):
+    buckets are right-closed, so a value equal to an edge takes the lower score.
+    
+    Args:
+        values: 1-D numeric array
+        n_bins: Number of score buckets
+        
+    Returns:
+        Integer scores aligned with values
+    """
+    edges = np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1])
+    return np.searchsorted(edges, values, side='left') + 1
+
+
+def rank_score(values: np.ndarray, n_bins: int = 5) -> np.ndarray:
+    """
+    Score values 1..n_bins by equal-sized rank buckets.
+    
+    Equivalent to pd.qcut(Series(values).rank(method='first'), n_bins,
+    labels=range(1, n_bins + 1)): ties are broken by position, so heavily
+    tied values still fill equal-sized buckets.
+    
+    Args:
+        values: 1-D numeric array
+        n_bins: Number of score buckets
+        
+    Returns:
+        Integer scores aligned with values
+    """
+    # Ranks 1..n from one stable argsort
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[np.argsort(values, kind='stable')] = np.arange(1, len(values) + 1)
+    return quantile_score(ranks, n_bins)
+
+
 def format_currency(value: float, currency: str = '£') -> str:
     """Format a number as currency."""
     if value >= 1_000_000:
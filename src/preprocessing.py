@@ -6,24 +6,70 @@ Cleans and prepares the Online Retail II dataset for analysis.
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from typing import Optional
 import argparse
 import warnings
-warnings.filterwarnings('ignore')
+
+# Imported as a script from src/ or as part of the src package
+try:
+    from metrics import rank_score, sum_by
+except ImportError:
+    from .metrics import rank_score, sum_by
 
 
 def load_raw_data(filepath: str) -> pd.DataFrame:
-    """Load raw data from Excel file."""
+    """Load raw data from the Excel file or its Parquet conversion."""
     print(f"📂 Loading data from {filepath}...")
     
-    # The dataset has two sheets: Year 2009-2010 and Year 2010-2011
-    df1 = pd.read_excel(filepath, sheet_name='Year 2009-2010')
-    df2 = pd.read_excel(filepath, sheet_name='Year 2010-2011')
+    if Path(filepath).suffix == '.parquet':
+        # Both sheets were already combined by ingest_raw.py
+        df = pd.read_parquet(filepath, engine='pyarrow')
+        print(f"   Loaded {len(df):,} rows")
+        return df
+    
+    # The dataset has two sheets: Year 2009-2010 and Year 2010-2011.
+    # Reading both in one call opens and indexes the workbook only once.
+    # openpyxl warns that the workbook has no default style; nothing else is silenced
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='Workbook contains no default style', category=UserWarning)
+        sheets = pd.read_excel(filepath, sheet_name=['Year 2009-2010', 'Year 2010-2011'])
     
-    df = pd.concat([df1, df2], ignore_index=True)
+    df = pd.concat(sheets.values(), ignore_index=True)
     print(f"   Loaded {len(df):,} rows")
     return df
 
 
+def quantile_cap(values: np.ndarray, q: float) -> float:
+    """
+    Linear-interpolated quantile of an array, as Series.quantile computes it.
+    
+    Only the two order statistics around the quantile are selected with
+    np.partition, so the array is never fully ordered.
+    
+    Args:
+        values: 1-D numeric array
+        q: Quantile between 0 and 1
+        
+    Returns:
+        The quantile, or NaN for an empty array
+    """
+    n = len(values)
+    if n == 0:
+        return np.nan
+    
+    # pandas passes q to np.percentile as a percentage; round-trip it the same way
+    position = (n - 1) * (q * 100 / 100)
+    lo = int(position)
+    hi = min(lo + 1, n - 1)
+    selected = np.partition(values, [lo, hi])
+    a, b = selected[lo], selected[hi]
+    
+    # Same interpolation formula as numpy, which switches ends at 0.5
+    t = position - lo
+    diff = b - a
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
 def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clean the dataset:
@@ -39,48 +85,130 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     # Standardize column names
     df.columns = df.columns.str.strip()
     
-    # Remove cancellations
-    df = df[~df['Invoice'].astype(str).str.startswith('C')]
-    print(f"   Removed cancellations: {initial_rows - len(df):,} rows")
+    # Build each filter as a mask and slice the frame once at the end;
+    # each count below is relative to the rows kept by the previous steps
+    keep = ~df['Invoice'].astype(str).str.startswith('C').to_numpy()
+    print(f"   Removed cancellations: {initial_rows - keep.sum():,} rows")
     
     # Remove missing CustomerID
-    rows_before = len(df)
-    df = df.dropna(subset=['Customer ID'])
-    print(f"   Removed missing CustomerID: {rows_before - len(df):,} rows")
+    rows_before = keep.sum()
+    keep &= df['Customer ID'].notna().to_numpy()
+    print(f"   Removed missing CustomerID: {rows_before - keep.sum():,} rows")
     
     # Remove negative/zero quantities and prices
-    rows_before = len(df)
-    df = df[(df['Quantity'] > 0) & (df['Price'] > 0)]
-    print(f"   Removed invalid quantity/price: {rows_before - len(df):,} rows")
+    rows_before = keep.sum()
+    quantity = df['Quantity'].to_numpy()
+    price = df['Price'].to_numpy()
+    keep &= (quantity > 0) & (price > 0)
+    print(f"   Removed invalid quantity/price: {rows_before - keep.sum():,} rows")
     
-    # Remove extreme outliers (keep 99th percentile)
-    rows_before = len(df)
-    quantity_cap = df['Quantity'].quantile(0.99)
-    price_cap = df['Price'].quantile(0.99)
-    df = df[(df['Quantity'] <= quantity_cap) & (df['Price'] <= price_cap)]
-    print(f"   Removed outliers: {rows_before - len(df):,} rows")
+    # Remove extreme outliers (keep 99th percentile of the rows still kept)
+    rows_before = keep.sum()
+    quantity_cap = quantile_cap(quantity[keep], 0.99)
+    price_cap = quantile_cap(price[keep], 0.99)
+    keep &= (quantity <= quantity_cap) & (price <= price_cap)
+    print(f"   Removed outliers: {rows_before - keep.sum():,} rows")
+    
+    df = df[keep].copy()
     
     # Convert types
-    df['Customer ID'] = df['Customer ID'].astype(int)
+    # IDs are five-digit numbers, so 32 bits halve the groupby key width
+    df['Customer ID'] = df['Customer ID'].astype('uint32')
     df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
     
     # Add calculated fields
     df['Revenue'] = df['Quantity'] * df['Price']
-    df['Year'] = df['InvoiceDate'].dt.year
-    df['Month'] = df['InvoiceDate'].dt.month
-    df['YearMonth'] = df['InvoiceDate'].dt.to_period('M')
-    df['DayOfWeek'] = df['InvoiceDate'].dt.dayofweek
-    df['Hour'] = df['InvoiceDate'].dt.hour
+    
+    # Date features from the raw datetime64 values: whole months and days
+    # since the epoch (1970-01-01 was a Thursday) give every field directly
+    timestamps = df['InvoiceDate'].to_numpy()
+    months = timestamps.astype('datetime64[M]').view('i8')
+    days = timestamps.astype('datetime64[D]').view('i8')
+    hours = timestamps.astype('datetime64[h]').view('i8')
+    df['Year'] = (months // 12 + 1970).astype('uint16')
+    df['Month'] = (months % 12 + 1).astype('uint8')
+    df['YearMonth'] = pd.arrays.PeriodArray(months, dtype='period[M]')
+    df['DayOfWeek'] = ((days + 3) % 7).astype('uint8')
+    df['Hour'] = (hours % 24).astype('uint8')
+    
+    # Text columns as categoricals, so later groupbys hash integer codes
+    df = df.astype({
+        'Invoice': 'category',
+        'StockCode': 'category',
+        'Description': 'category',
+        'Country': 'category'
+    })
     
     print(f"✅ Cleaning complete: {len(df):,} rows remaining ({len(df)/initial_rows*100:.1f}%)")
     return df
 
 
+def load_cleaned(cache_path: Path, raw_path: Path) -> Optional[pd.DataFrame]:
+    """
+    Load the cleaned data cached by a previous run, if it is still current.
+    
+    Args:
+        cache_path: Parquet file written after clean_data
+        raw_path: Raw data file the cache was built from
+        
+    Returns:
+        Cleaned DataFrame, or None if there is no cache or the raw data is newer
+    """
+    if not cache_path.exists() or cache_path.stat().st_mtime < raw_path.stat().st_mtime:
+        return None
+    
+    print(f"📂 Loading cleaned data from {cache_path}...")
+    df = pd.read_parquet(cache_path, engine='pyarrow')
+    print(f"   Loaded {len(df):,} rows (delete the file or use --rebuild to re-clean)")
+    return df
+
+
 def create_sample(df: pd.DataFrame, n_rows: int = 10000, seed: int = 42) -> pd.DataFrame:
     """Create a deterministic sample for quick testing."""
-    np.random.seed(seed)
-    sample = df.sample(n=min(n_rows, len(df)), random_state=seed)
-    return sample.sort_values('InvoiceDate')
+    # Same draw as df.sample(random_state=seed), taken in row order so the
+    # gather is sequential and same-time lines keep their original order
+    positions = np.random.RandomState(seed).choice(len(df), size=min(n_rows, len(df)), replace=False)
+    sample = df.take(np.sort(positions))
+    return sample.sort_values('InvoiceDate', kind='stable')
+
+
+def format_year_months(year_month: pd.Series) -> np.ndarray:
+    """
+    Format a monthly Period column as 'YYYY-MM' strings.
+    
+    Each distinct month is formatted once and the strings are gathered back
+    by code, instead of formatting every row.
+    """
+    codes, months = pd.factorize(year_month)
+    return months.astype(str).to_numpy()[codes]
+
+
+def segment_rfm(r, f, m) -> np.ndarray:
+    """
+    Label customers with an RFM segment from their 1-5 scores.
+    
+    Args:
+        r: Recency scores (5 is most recent)
+        f: Frequency scores
+        m: Monetary scores
+        
+    Returns:
+        Array of segment names aligned with the scores
+    """
+    r = np.asarray(r).astype(int)
+    f = np.asarray(f).astype(int)
+    m = np.asarray(m).astype(int)
+    
+    # First matching rule wins
+    conditions = [
+        (r >= 4) & (f >= 4) & (m >= 4),
+        (r >= 3) & (f >= 3) & (m >= 3),
+        (r >= 4) & (f <= 2),
+        (r <= 2) & (f >= 3) & (m >= 3),
+        (r <= 2) & (f <= 2)
+    ]
+    segments = ['Champions', 'Loyal Customers', 'New Customers', 'At Risk', 'Lost']
+    return np.select(conditions, segments, default='Potential Loyalists')
 
 
 def calculate_rfm(df: pd.DataFrame) -> pd.DataFrame:
@@ -93,40 +221,31 @@ def calculate_rfm(df: pd.DataFrame) -> pd.DataFrame:
     reference_date = df['InvoiceDate'].max() + pd.Timedelta(days=1)
     
     # Calculate RFM metrics per customer
-    rfm = df.groupby('Customer ID').agg({
-        'InvoiceDate': lambda x: (reference_date - x.max()).days,  # Recency
+    rfm = df.groupby('Customer ID', observed=True).agg({
+        'InvoiceDate': 'max',  # Last purchase
         'Invoice': 'nunique',  # Frequency
         'Revenue': 'sum'  # Monetary
     }).reset_index()
     
-    rfm.columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary']
+    rfm.columns = ['CustomerID', 'LastPurchase', 'Frequency', 'Monetary']
+    
+    # Recency: days since last purchase, in one vectorized subtraction
+    rfm.insert(1, 'Recency', (reference_date - rfm.pop('LastPurchase')).dt.days)
     
     # Score each metric (1-5, where 5 is best)
     rfm['R_Score'] = pd.qcut(rfm['Recency'], q=5, labels=[5, 4, 3, 2, 1])
-    rfm['F_Score'] = pd.qcut(rfm['Frequency'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5])
-    rfm['M_Score'] = pd.qcut(rfm['Monetary'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5])
+    rfm['F_Score'] = rank_score(rfm['Frequency'].to_numpy())
+    rfm['M_Score'] = rank_score(rfm['Monetary'].to_numpy())
     
-    # Combined RFM Score
-    rfm['RFM_Score'] = rfm['R_Score'].astype(str) + rfm['F_Score'].astype(str) + rfm['M_Score'].astype(str)
+    # Combined RFM Score as a three-digit integer (e.g. R=5, F=4, M=3 -> 543)
+    rfm['RFM_Score'] = (
+        rfm['R_Score'].astype(np.int16) * 100
+        + rfm['F_Score'].astype(np.int16) * 10
+        + rfm['M_Score'].astype(np.int16)
+    )
     
     # Segment labels
-    def segment_customer(row):
-        r, f, m = int(row['R_Score']), int(row['F_Score']), int(row['M_Score'])
-        
-        if r >= 4 and f >= 4 and m >= 4:
-            return 'Champions'
-        elif r >= 3 and f >= 3 and m >= 3:
-            return 'Loyal Customers'
-        elif r >= 4 and f <= 2:
-            return 'New Customers'
-        elif r <= 2 and f >= 3 and m >= 3:
-            return 'At Risk'
-        elif r <= 2 and f <= 2:
-            return 'Lost'
-        else:
-            return 'Potential Loyalists'
-    
-    rfm['Segment'] = rfm.apply(segment_customer, axis=1)
+    rfm['Segment'] = segment_rfm(rfm['R_Score'], rfm['F_Score'], rfm['M_Score'])
     
     print(f"   Segmented {len(rfm):,} customers")
     return rfm
@@ -134,29 +253,35 @@ def calculate_rfm(df: pd.DataFrame) -> pd.DataFrame:
 
 def generate_summary_stats(df: pd.DataFrame) -> dict:
     """Generate summary statistics for the dashboard."""
+    total_revenue = df['Revenue'].sum()
+    total_transactions = df['Invoice'].nunique()
+    
     stats = {
-        'total_revenue': df['Revenue'].sum(),
-        'total_transactions': df['Invoice'].nunique(),
+        'total_revenue': total_revenue,
+        'total_transactions': total_transactions,
         'total_customers': df['Customer ID'].nunique(),
         'total_products': df['StockCode'].nunique(),
-        'avg_order_value': df.groupby('Invoice')['Revenue'].sum().mean(),
+        # Mean of per-invoice totals is total revenue over the invoice count
+        'avg_order_value': total_revenue / total_transactions,
         'date_range': {
             'start': df['InvoiceDate'].min().strftime('%Y-%m-%d'),
             'end': df['InvoiceDate'].max().strftime('%Y-%m-%d')
         },
-        'top_countries': df.groupby('Country')['Revenue'].sum().nlargest(10).to_dict(),
-        'monthly_revenue': df.groupby('YearMonth')['Revenue'].sum().to_dict()
+        'top_countries': sum_by(df['Country'], df['Revenue']).nlargest(10).to_dict(),
+        'monthly_revenue': sum_by(df['YearMonth'], df['Revenue']).to_dict()
     }
     return stats
 
 
-def main(use_sample: bool = False):
+def main(use_sample: bool = False, rebuild: bool = False):
     """Main preprocessing pipeline."""
     
     # Paths
     project_root = Path(__file__).parent.parent
     raw_data_path = project_root / 'data' / 'raw' / 'online_retail_II.xlsx'
+    raw_parquet_path = raw_data_path.with_suffix('.parquet')
     processed_path = project_root / 'data' / 'processed'
+    cleaned_cache_path = processed_path / 'cleaned.parquet'
     sample_path = project_root / 'data' / 'sample'
     
     # Create directories
@@ -164,7 +289,7 @@ def main(use_sample: bool = False):
     sample_path.mkdir(parents=True, exist_ok=True)
     
     # Check if raw data exists
-    if not raw_data_path.exists():
+    if not raw_data_path.exists() and not raw_parquet_path.exists():
         print("⚠️  Raw data not found!")
         print(f"   Please download from: https://archive.ics.uci.edu/dataset/502/online+retail+ii")
         print(f"   And place 'online_retail_II.xlsx' in: {raw_data_path}")
@@ -178,18 +303,37 @@ def main(use_sample: bool = False):
             print("\n❌ No sample data available. Please download the dataset.")
             return
     
-    # Load and clean data
-    df = load_raw_data(raw_data_path)
-    df = clean_data(df)
+    # Convert the workbook to Parquet once (again if the workbook is replaced)
+    if raw_data_path.exists() and (
+        not raw_parquet_path.exists() or raw_parquet_path.stat().st_mtime < raw_data_path.stat().st_mtime
+    ):
+        from ingest_raw import convert_excel_to_parquet
+        convert_excel_to_parquet(raw_data_path, raw_parquet_path)
+    
+    # Load and clean data, reusing the last cleaned result if the raw data is unchanged
+    df = None if rebuild else load_cleaned(cleaned_cache_path, raw_parquet_path)
+    if df is None:
+        df = load_raw_data(raw_parquet_path)
+        df = clean_data(df)
+        df.to_parquet(cleaned_cache_path, index=False, engine='pyarrow', compression='zstd')
     
     # Calculate RFM
     rfm = calculate_rfm(df)
     
-    # Save processed data
+    # Save processed data. YearMonth is written as 'YYYY-MM' text; formatting
+    # it up front keeps the writers from boxing a Period object per row.
     print("\n💾 Saving processed data...")
-    df.to_csv(processed_path / 'cleaned_transactions.csv', index=False)
+    export = df.assign(YearMonth=format_year_months(df['YearMonth']))
+    export.to_csv(processed_path / 'cleaned_transactions.csv', index=False)
     rfm.to_csv(processed_path / 'customer_rfm.csv', index=False)
     
+    # Parquet copies for the loaders (typed, no text parsing on read).
+    # Invoice/StockCode mix ints and strings in the raw file.
+    export.astype({'Invoice': str, 'StockCode': str}).to_parquet(
+        processed_path / 'cleaned_transactions.parquet', index=False, engine='pyarrow', compression='zstd'
+    )
+    rfm.to_parquet(processed_path / 'customer_rfm.parquet', index=False, engine='pyarrow', compression='zstd')
+    
     # Create and save sample
     sample = create_sample(df)
     sample.to_csv(sample_path / 'sample_data.csv', index=False)
@@ -209,6 +353,7 @@ def main(use_sample: bool = False):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Preprocess Online Retail II dataset')
     parser.add_argument('--sample', action='store_true', help='Use sample data only')
+    parser.add_argument('--rebuild', action='store_true', help='Re-clean the raw data even if a cached result is current')
     args = parser.parse_args()
     
-    main(use_sample=args.sample)
+    main(use_sample=args.sample, rebuild=args.rebuild)